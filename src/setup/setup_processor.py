@@ -7,10 +7,14 @@ import hashlib
 import subprocess
 import requests
 import time
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 
 IPFS_API = os.getenv('IPFS_API', 'http://ipfs:5001')
 
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
 class SetupProcessor:
     def __init__(self, workspace_dir='/workspace', processed_dir='/data/processed', state_dir='/state'):
         self.workspace_dir = Path(workspace_dir)
@@ -218,29 +222,41 @@ class SetupProcessor:
             'output_dir': str(output_dir.relative_to(self.processed_dir))
         }
     
-    def upload_to_ipfs(self, file_path):
+    def upload_many_to_ipfs(self, file_paths):
         ipfs_config = self.setup_config.get('ipfs', {})
         timeout = ipfs_config.get('timeout', 30)
         pin = ipfs_config.get('pin_segments', True)
         
+        handles = []
         try:
-            with open(file_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(
-                    f'{IPFS_API}/api/v0/add?pin={str(pin).lower()}',
-                    files=files,
-                    timeout=timeout
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result['Hash']
-                else:
-                    print(f"  ERROR: IPFS upload failed for {file_path.name}: {response.text}")
-                    return None
+            files = []
+            for file_path in file_paths:
+                f = open(file_path, 'rb')
+                handles.append(f)
+                files.append(('file', (file_path.name, f)))
+            
+            response = SESSION.post(
+                f'{IPFS_API}/api/v0/add?pin={str(pin).lower()}',
+                files=files,
+                timeout=timeout
+            )
+            
+            if response.status_code == 200:
+                cids = {}
+                for line in response.text.splitlines():
+                    if line.strip():
+                        entry = json.loads(line)
+                        cids[entry['Name']] = entry['Hash']
+                return cids
+            else:
+                print(f"  ERROR: IPFS upload failed for {len(file_paths)} files: {response.text}")
+                return None
         except Exception as e:
-            print(f"  ERROR: Exception uploading {file_path.name}: {e}")
+            print(f"  ERROR: Exception uploading {len(file_paths)} files: {e}")
             return None
+        finally:
+            for f in handles:
+                f.close()
     
     def process_track(self, track_file, track_index, file_type='track'):
         duration, error = self.verify_audio_file(track_file)
@@ -260,18 +276,27 @@ class SetupProcessor:
         print(f"  Uploading segments to IPFS...")
         segment_cids = []
         
-        for segment_name in chunk_info['segments']:
-            segment_path = track_dir / segment_name
-            cid = self.upload_to_ipfs(segment_path)
-            if cid:
-                segment_cids.append({
-                    'filename': segment_name,
-                    'cid': cid
-                })
-                print(f"    {segment_name} -> {cid}")
-            else:
-                print(f"    Failed to upload {segment_name}")
+        segment_names = chunk_info['segments']
+        batch_size = self.setup_config.get('ipfs', {}).get('upload_batch_size', 32)
+        
+        for start in range(0, len(segment_names), batch_size):
+            batch = segment_names[start:start + batch_size]
+            cids = self.upload_many_to_ipfs([track_dir / name for name in batch])
+            if cids is None:
+                print(f"    Failed to upload segments {batch[0]}..{batch[-1]}")
                 return None
+            
+            for segment_name in batch:
+                cid = cids.get(segment_name)
+                if cid:
+                    segment_cids.append({
+                        'filename': segment_name,
+                        'cid': cid
+                    })
+                    print(f"    {segment_name} -> {cid}")
+                else:
+                    print(f"    Failed to upload {segment_name}")
+                    return None
         
         return {
             'filename': chunk_info['filename'],
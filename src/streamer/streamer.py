@@ -2,12 +2,20 @@
 
 import os
 import sys
+import atexit
+import signal
 import json
 import time
+import queue
 import requests
 import logging
+import tempfile
+import itertools
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 
 IPFS_API = os.getenv('IPFS_API', 'http://ipfs:5001')
 IPFS_GATEWAY = os.getenv('IPFS_GATEWAY', 'http://ipfs:8080')
@@ -19,6 +27,12 @@ MANIFEST_FILE = os.path.join(PROCESSED_DIR, 'manifest.json')
 PLAYLIST_FILE = os.path.join(STATE_DIR, 'playlist.m3u')
 IPNS_STATE_FILE = os.path.join(STATE_DIR, 'ipns_keys.json')
 CONFIG_FILE = os.getenv('STREAMING_CONFIG', '/workspace/streaming.config.json')
+MFS_ROOT = f'/sleetbubble/{NODE_ID}'
+RESOLVE_PROBE_INTERVAL = 3600
+KEYS_CACHE_MAX_AGE = 60
+STATE_FLUSH_INTERVAL = 10
+STARTUP_ATTEMPTS = 6
+STARTUP_BACKOFF = 0.5
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,10 +40,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DEBUG_JSON = os.getenv('SLEET_DEBUG_JSON') == '1'
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps_option = orjson.OPT_INDENT_2 if DEBUG_JSON else 0
+    
+    def _dumps(obj):
+        return orjson.dumps(obj, option=_dumps_option)
+except ImportError:
+    _loads = json.loads
+    _dumps_kwargs = {'indent': 2} if DEBUG_JSON else {'separators': (',', ':')}
+    
+    def _dumps(obj):
+        return json.dumps(obj, **_dumps_kwargs).encode('utf-8')
+
+def _atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.2)
+))
+
 class StreamingConfig:
     def __init__(self, config_path):
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        with open(config_path, 'rb') as f:
+            config = _loads(f.read())
         
         self.window_size = config['streaming']['window_size']
         self.update_interval = config['streaming']['update_interval']
@@ -46,70 +97,98 @@ class StreamingConfig:
                    f"advance_every={self.advance_every}")
 
 class IPNSManager:
-    def __init__(self):
+    def __init__(self, ipfs_id=None):
         self.keys = self.load_keys()
-        self.ipfs_id = self.get_ipfs_id()
+        self.ipfs_id = ipfs_id or self.get_ipfs_id()
+        if self._keys_cache_is_fresh():
+            logger.info(f"Using cached IPNS keys from {IPNS_STATE_FILE}")
+        else:
+            self._refresh_keys_from_ipfs()
+        
+        self._stop = threading.Event()
+        self._publish_queue = queue.Queue(maxsize=1)
+        self._published_names = set()
+        self._publish_thread = threading.Thread(target=self._publish_worker, daemon=True)
+        self._publish_thread.start()
+        
+        self._resolve_probe_thread = threading.Thread(target=self._resolve_probe_worker, daemon=True)
+        self._resolve_probe_thread.start()
     
     def get_ipfs_id(self):
         try:
-            response = requests.post(f'{IPFS_API}/api/v0/id', timeout=5)
+            response = SESSION.post(f'{IPFS_API}/api/v0/id', timeout=5)
             if response.status_code == 200:
-                return response.json()['ID']
+                return _loads(response.content)['ID']
         except Exception as e:
             logger.error(f"Failed to get IPFS ID: {e}")
         return None
     
     def load_keys(self):
-        if os.path.exists(IPNS_STATE_FILE):
-            try:
-                with open(IPNS_STATE_FILE, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Failed to load IPNS keys: {e}")
+        try:
+            with open(IPNS_STATE_FILE, 'rb') as f:
+                return _loads(f.read())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to load IPNS keys: {e}")
         return {}
     
     def save_keys(self):
         try:
             os.makedirs(STATE_DIR, exist_ok=True)
-            with open(IPNS_STATE_FILE, 'w') as f:
-                json.dump(self.keys, f, indent=2)
+            _atomic_write(IPNS_STATE_FILE, _dumps(self.keys))
         except Exception as e:
             logger.error(f"Failed to save IPNS keys: {e}")
     
-    def ensure_key(self, name):
-        if name in self.keys:
-            return self.keys[name]
-        
+    def _keys_cache_is_fresh(self):
+        if not self.keys:
+            return False
         try:
-            response = requests.post(
+            return time.time() - os.stat(IPNS_STATE_FILE).st_mtime < KEYS_CACHE_MAX_AGE
+        except OSError:
+            return False
+    
+    def _refresh_keys_from_ipfs(self):
+        try:
+            response = SESSION.post(
                 f'{IPFS_API}/api/v0/key/list',
                 timeout=5
             )
             
             if response.status_code == 200:
-                existing_keys = response.json().get('Keys', [])
-                for key in existing_keys:
-                    if key['Name'] == name:
-                        self.keys[name] = key['Id']
-                        self.save_keys()
-                        logger.info(f"Found existing IPNS key: {name} → {key['Id']}")
-                        return key['Id']
-            
-            response = requests.post(
+                existing_keys = _loads(response.content).get('Keys', [])
+                self.keys.update({key['Name']: key['Id'] for key in existing_keys})
+                self.save_keys()
+                logger.info(f"Loaded {len(existing_keys)} IPNS keys from IPFS")
+            else:
+                logger.error(f"Failed to list IPNS keys: {response.text}")
+        except Exception as e:
+            logger.error(f"Error listing IPNS keys: {e}")
+    
+    def ensure_key(self, name):
+        if name in self.keys:
+            return self.keys[name]
+        
+        try:
+            response = SESSION.post(
                 f'{IPFS_API}/api/v0/key/gen',
                 params={'arg': name, 'type': 'ed25519'},
                 timeout=10
             )
             
             if response.status_code == 200:
-                key_id = response.json()['Id']
+                key_id = _loads(response.content)['Id']
                 self.keys[name] = key_id
                 self.save_keys()
                 logger.info(f"✓ Created IPNS key: {name} → {key_id}")
                 return key_id
-            else:
-                logger.error(f"Failed to create key: {response.text}")
-                return None
+            
+            self._refresh_keys_from_ipfs()
+            if name in self.keys:
+                return self.keys[name]
+            
+            logger.error(f"Failed to create key: {response.text}")
+            return None
         
         except Exception as e:
             logger.error(f"Error ensuring key {name}: {e}")
@@ -122,20 +201,20 @@ class IPNSManager:
                 'key': name,
                 'lifetime': lifetime,
                 'ttl': ttl,
-                'resolve': 'true'
+                'resolve': 'false'
             }
             
             if allow_offline:
                 params['allow-offline'] = 'true'
             
-            response = requests.post(
+            response = SESSION.post(
                 f'{IPFS_API}/api/v0/name/publish',
                 params=params,
                 timeout=30
             )
             
             if response.status_code == 200:
-                result = response.json()
+                result = _loads(response.content)
                 ipns_name = result.get('Name', result.get('name'))
                 logger.info(f"✓ Published {name}: /ipns/{ipns_name} → /ipfs/{cid}")
                 return ipns_name
@@ -146,6 +225,58 @@ class IPNSManager:
         except Exception as e:
             logger.error(f"Error publishing to IPNS {name}: {e}")
             return None
+    
+    def check_resolve(self, name):
+        key_id = self.keys.get(name)
+        if not key_id:
+            return None
+        
+        try:
+            response = SESSION.post(
+                f'{IPFS_API}/api/v0/name/resolve',
+                params={'arg': f'/ipns/{key_id}', 'nocache': 'true'},
+                timeout=60
+            )
+            
+            if response.status_code == 200:
+                path = _loads(response.content).get('Path')
+                logger.info(f"✓ Resolve check {name}: /ipns/{key_id} → {path}")
+                return path
+            else:
+                logger.warning(f"Resolve check failed for {name}: {response.status_code} - {response.text}")
+                return None
+        
+        except Exception as e:
+            logger.warning(f"Error resolving IPNS {name}: {e}")
+            return None
+    
+    def publish_async(self, name, cid, lifetime, ttl, allow_offline=True):
+        item = (name, cid, lifetime, ttl, allow_offline)
+        while True:
+            try:
+                self._publish_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    stale = self._publish_queue.get_nowait()
+                    logger.debug(f"Dropping superseded publish of {stale[0]} → /ipfs/{stale[1]}")
+                except queue.Empty:
+                    pass
+    
+    def _publish_worker(self):
+        while True:
+            name, cid, lifetime, ttl, allow_offline = self._publish_queue.get()
+            if self.publish(name, cid, lifetime, ttl, allow_offline):
+                self._published_names.add(name)
+    
+    def _resolve_probe_worker(self):
+        while not self._stop.wait(RESOLVE_PROBE_INTERVAL):
+            for name in list(self._published_names):
+                self.check_resolve(name)
+    
+    def close(self):
+        self._stop.set()
+        self._resolve_probe_thread.join(timeout=5)
 
 class SlidingWindowStreamer:
     def __init__(self, config, ipns_manager):
@@ -154,11 +285,35 @@ class SlidingWindowStreamer:
         
         self.manifest = self.load_manifest()
         self.playlist_entries = self.load_playlist()
+        self._total_segments = len(self.playlist_entries)
+        self._ring = self.playlist_entries + self.playlist_entries[:self.config.max_segments]
         
         self.sequence_state_file = os.path.join(STATE_DIR, 'sequence_state.json')
         state = self.load_sequence_state()
         self.sequence_number = state['sequence']
+        self._last_saved_sequence = self.sequence_number
+        self._last_sequence_flush = time.monotonic()
         self.update_counter = 0
+        self._window_cache = (None, None)
+        
+        self._last_window_key = None
+        self._last_playlist_cid = None
+        
+        self._stream_info_path = os.path.join(STATE_DIR, 'stream_info.json')
+        self._pending_info = None
+        self._last_info_ipns = None
+        self._last_info_flush = 0.0
+        self._info_static = {'node_id': NODE_ID}
+        self._header_template = (
+            b'#EXTM3U\n'
+            b'#EXT-X-VERSION:3\n'
+            b'#EXT-X-TARGETDURATION:7\n'
+            b'#EXT-X-MEDIA-SEQUENCE:%d\n'
+        )
+        self._segment_fragments = {
+            cid: b'#EXTINF:6.0,\n/ipfs/' + cid.encode('ascii') + b'?t='
+            for cid in set(self.playlist_entries)
+        }
         
         key_name = 'sleetbubble-sex'
         key_id = self.ipns.ensure_key(key_name)
@@ -170,8 +325,8 @@ class SlidingWindowStreamer:
     
     def load_manifest(self):
         try:
-            with open(MANIFEST_FILE, 'r') as f:
-                manifest = json.load(f)
+            with open(MANIFEST_FILE, 'rb') as f:
+                manifest = _loads(f.read())
             logger.info(f"✓ Loaded manifest with {len(manifest['tracks'])} tracks")
             return manifest
         except Exception as e:
@@ -179,14 +334,10 @@ class SlidingWindowStreamer:
             sys.exit(1)
     
     def load_playlist(self):
-        entries = []
         try:
             with open(PLAYLIST_FILE, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('/ipfs/'):
-                        cid = line.replace('/ipfs/', '')
-                        entries.append(cid)
+                lines = f.read().splitlines()
+            entries = tuple(line[6:] for line in map(str.strip, lines) if line.startswith('/ipfs/'))
             logger.info(f"✓ Loaded playlist with {len(entries)} segments")
             return entries
         except Exception as e:
@@ -194,45 +345,59 @@ class SlidingWindowStreamer:
             sys.exit(1)
     
     def load_sequence_state(self):
-        if os.path.exists(self.sequence_state_file):
-            try:
-                with open(self.sequence_state_file, 'r') as f:
-                    state = json.load(f)
-                logger.info(f"✓ Restored sequence state: sequence={state['sequence']}")
-                return state
-            except Exception as e:
-                logger.warning(f"Failed to load sequence state: {e}, starting fresh")
+        try:
+            with open(self.sequence_state_file, 'rb') as f:
+                state = _loads(f.read())
+            logger.info(f"✓ Restored sequence state: sequence={state['sequence']}")
+            return state
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to load sequence state: {e}, starting fresh")
         
         return {'sequence': 0}
     
-    def save_sequence_state(self):
+    def save_sequence_state(self, force=False):
+        if self.sequence_number == self._last_saved_sequence:
+            return
+        if not force and time.monotonic() - self._last_sequence_flush < STATE_FLUSH_INTERVAL:
+            return
+        
         try:
             os.makedirs(STATE_DIR, exist_ok=True)
             state = {
                 'sequence': self.sequence_number,
                 'timestamp': datetime.utcnow().isoformat()
             }
-            with open(self.sequence_state_file, 'w') as f:
-                json.dump(state, f, indent=2)
+            _atomic_write(self.sequence_state_file, _dumps(state))
+            self._last_saved_sequence = self.sequence_number
+            self._last_sequence_flush = time.monotonic()
         except Exception as e:
             logger.error(f"Failed to save sequence state: {e}")
     
     def get_window_segments(self):
-        total_segments = len(self.playlist_entries)
+        if self._window_cache[0] == self.sequence_number:
+            return self._window_cache[1]
+        
+        total_segments = self._total_segments
         if total_segments == 0:
             return []
         
-        window_segments = []
         current_position = self.sequence_number % total_segments
+        max_segments = self.config.max_segments
         
-        for i in range(self.config.max_segments):
-            playlist_index = (current_position + i) % total_segments
-            window_segments.append(self.playlist_entries[playlist_index])
+        if max_segments <= total_segments:
+            window = self._ring[current_position:current_position + max_segments]
+        else:
+            window = tuple(itertools.islice(
+                itertools.cycle(self.playlist_entries), current_position, current_position + max_segments
+            ))
         
-        return window_segments
+        self._window_cache = (self.sequence_number, window)
+        return window
     
     def advance_window(self):
-        total_segments = len(self.playlist_entries)
+        total_segments = self._total_segments
         if total_segments == 0:
             return
         
@@ -241,6 +406,7 @@ class SlidingWindowStreamer:
         if self.update_counter >= self.config.advance_every:
             self.sequence_number += 1
             self.update_counter = 0
+            self._window_cache = (None, None)
             self.save_sequence_state()
             current_playlist_pos = self.sequence_number % total_segments
             logger.debug(f"Stream advanced - sequence: {self.sequence_number}, playlist position: {current_playlist_pos}")
@@ -251,36 +417,46 @@ class SlidingWindowStreamer:
         if not segments:
             return None
         
-        current_time = datetime.utcnow()
-        timestamp = int(current_time.timestamp())
-        
-        lines = [
-            '#EXTM3U',
-            '#EXT-X-VERSION:3',
-            '#EXT-X-TARGETDURATION:7',
-            f'#EXT-X-MEDIA-SEQUENCE:{self.sequence_number}',
-        ]
+        now = time.time()
+        now_seconds = int(now)
+        timestamp_line = b'%d\n' % now_seconds
+        millis_suffix = b'.%03dZ\n' % int((now - now_seconds) * 1000)
+        fragments = self._segment_fragments
+        count = len(segments)
         
+        parts = [self._header_template % self.sequence_number]
         for i, cid in enumerate(segments):
-            segment_time = current_time - timedelta(seconds=(len(segments) - i - 1) * 6)
-            lines.append(f'#EXT-X-PROGRAM-DATE-TIME:{segment_time.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}Z')
-            lines.append('#EXTINF:6.0,')
-            lines.append(f'/ipfs/{cid}?t={timestamp}')
+            segment_time = time.gmtime(now_seconds - (count - i - 1) * 6)
+            parts.append(b'#EXT-X-PROGRAM-DATE-TIME:%04d-%02d-%02dT%02d:%02d:%02d' % segment_time[:6])
+            parts.append(millis_suffix)
+            parts.append(fragments[cid])
+            parts.append(timestamp_line)
         
-        return '\n'.join(lines) + '\n'
+        return b''.join(parts)
     
     def upload_to_ipfs(self, content, filename):
+        mfs_path = f'{MFS_ROOT}/{filename}'
         try:
-            files = {'file': (filename, content.encode('utf-8'))}
-            response = requests.post(
-                f'{IPFS_API}/api/v0/add',
-                params={'pin': 'true', 'quiet': 'true'},
+            files = {'file': (filename, content)}
+            response = SESSION.post(
+                f'{IPFS_API}/api/v0/files/write',
+                params={'arg': mfs_path, 'create': 'true', 'truncate': 'true', 'parents': 'true'},
                 files=files,
                 timeout=30
             )
             
+            if response.status_code != 200:
+                logger.error(f"IPFS API error: {response.status_code}")
+                return None
+            
+            response = SESSION.post(
+                f'{IPFS_API}/api/v0/files/stat',
+                params={'arg': mfs_path, 'hash': 'true'},
+                timeout=10
+            )
+            
             if response.status_code == 200:
-                result = response.json()
+                result = _loads(response.content)
                 return result['Hash']
             else:
                 logger.error(f"IPFS API error: {response.status_code}")
@@ -299,6 +475,12 @@ class SlidingWindowStreamer:
             logger.error("No segments in window")
             return False
         
+        window_key = (self.sequence_number, window_segments)
+        if window_key == self._last_window_key:
+            self.write_stream_info(self.stream_key['id'])
+            self.advance_window()
+            return True
+        
         playlist_content = self.generate_hls_playlist(window_segments)
         if not playlist_content:
             return False
@@ -307,39 +489,80 @@ class SlidingWindowStreamer:
         if not playlist_cid:
             return False
         
-        stream_ipns = self.ipns.publish(
-            self.stream_key['name'],
-            playlist_cid,
-            self.config.ipns_lifetime,
-            self.config.ipns_ttl,
-            self.config.ipns_allow_offline
-        )
+        if playlist_cid != self._last_playlist_cid:
+            self.ipns.publish_async(
+                self.stream_key['name'],
+                playlist_cid,
+                self.config.ipns_lifetime,
+                self.config.ipns_ttl,
+                self.config.ipns_allow_offline
+            )
         
-        if not stream_ipns:
-            return False
+        self._last_window_key = window_key
+        self._last_playlist_cid = playlist_cid
         
-        self.write_stream_info(stream_ipns)
+        self.write_stream_info(self.stream_key['id'])
         self.advance_window()
         
         return True
     
     def write_stream_info(self, stream_ipns):
-        current_playlist_pos = self.sequence_number % len(self.playlist_entries)
+        current_playlist_pos = self.sequence_number % self._total_segments
         info = {
             'stream_playlist_ipns': stream_ipns,
             'stream_playlist_url': f'{IPFS_GATEWAY}/ipns/{stream_ipns}',
             'sequence_number': self.sequence_number,
             'playlist_position': current_playlist_pos,
-            'updated_at': datetime.utcnow().isoformat(),
-            'node_id': NODE_ID,
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()),
+            **self._info_static,
         }
         
+        self._pending_info = info
+        if (stream_ipns != self._last_info_ipns
+                or time.monotonic() - self._last_info_flush >= STATE_FLUSH_INTERVAL):
+            self.flush_stream_info()
+    
+    def flush_stream_info(self):
+        if self._pending_info is None:
+            return
+        
         try:
-            stream_info_path = os.path.join(STATE_DIR, 'stream_info.json')
-            with open(stream_info_path, 'w') as f:
-                json.dump(info, f, indent=2)
+            _atomic_write(self._stream_info_path, _dumps(self._pending_info))
+            self._last_info_ipns = self._pending_info['stream_playlist_ipns']
+            self._last_info_flush = time.monotonic()
+            self._pending_info = None
         except Exception as e:
             logger.error(f"Failed to write stream info: {e}")
+    
+    def flush_state(self):
+        self.save_sequence_state(force=True)
+        self.flush_stream_info()
+
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+def connect_to_ipfs():
+    try:
+        SESSION.post(f'{IPFS_API}/api/v0/version', timeout=5)
+    except Exception:
+        pass
+    
+    delay = STARTUP_BACKOFF
+    for attempt in range(1, STARTUP_ATTEMPTS + 1):
+        try:
+            response = SESSION.post(f'{IPFS_API}/api/v0/id', timeout=5)
+            if response.status_code == 200:
+                return _loads(response.content)['ID']
+            logger.warning(f"IPFS API not ready (HTTP {response.status_code}), attempt {attempt}/{STARTUP_ATTEMPTS}")
+        except Exception as e:
+            logger.warning(f"Cannot connect to IPFS: {e}, attempt {attempt}/{STARTUP_ATTEMPTS}")
+        
+        if attempt < STARTUP_ATTEMPTS:
+            time.sleep(delay)
+            delay *= 2
+    
+    logger.error("Failed to connect to IPFS API")
+    sys.exit(1)
 
 def main():
     logger.info("=" * 60)
@@ -348,21 +571,14 @@ def main():
     logger.info(f"IPFS API: {IPFS_API}")
     logger.info(f"IPFS Gateway: {IPFS_GATEWAY}")
     
-    try:
-        response = requests.post(f'{IPFS_API}/api/v0/id', timeout=5)
-        if response.status_code == 200:
-            ipfs_id = response.json()
-            logger.info(f"✓ Connected to IPFS node: {ipfs_id['ID'][:16]}...")
-        else:
-            logger.error("Failed to connect to IPFS API")
-            sys.exit(1)
-    except Exception as e:
-        logger.error(f"Cannot connect to IPFS: {e}")
-        sys.exit(1)
+    ipfs_id = connect_to_ipfs()
+    logger.info(f"✓ Connected to IPFS node: {ipfs_id[:16]}...")
     
     config = StreamingConfig(CONFIG_FILE)
-    ipns_manager = IPNSManager()
+    ipns_manager = IPNSManager(ipfs_id)
     streamer = SlidingWindowStreamer(config, ipns_manager)
+    atexit.register(streamer.flush_state)
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
     logger.info("=" * 60)
     logger.info("Starting streaming loop...")
@@ -390,6 +606,9 @@ def main():
     except KeyboardInterrupt:
         logger.info("Shutting down...")
     
+    streamer.flush_state()
+    ipns_manager.close()
+    
     logger.info("Service stopped")
 
 
@@ -1,13 +1,215 @@
 #!/usr/bin/env python3
 # inspired by https://github.com/meehow/peer-id-generator
+import os
 import sys
 import time
 import base64
+import threading
 import requests
 import subprocess
+import multiprocessing
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+
+try:
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+    from cryptography.hazmat.primitives import serialization
+except ImportError:
+    ed25519 = None
 
 IPFS_API = 'http://localhost:5001'
+KEYS_DIR = Path('/workspaces/sleet_test/keys')
+CONCURRENCY = 16
+LOCAL_BATCH_SIZE = 2000
+PROGRESS_INTERVAL = 1.0
+
+BASE36_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+LIBP2P_ED25519_PUBKEY_PREFIX = b'\x08\x01\x12\x20'
+LIBP2P_ED25519_PRIVKEY_PREFIX = b'\x08\x01\x12\x40'
+CIDV1_LIBP2P_KEY_IDENTITY_PREFIX = b'\x01\x72\x00\x24'
+PEER_ID_PREFIX = CIDV1_LIBP2P_KEY_IDENTITY_PREFIX + LIBP2P_ED25519_PUBKEY_PREFIX
+BASE36_TRIPLETS = tuple(a + b + c for a in BASE36_ALPHABET for b in BASE36_ALPHABET for c in BASE36_ALPHABET)
+
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=CONCURRENCY * 2))
+
+def matches_position(key_id, substring, position):
+    key_lower = key_id.lower()
+    substring_lower = substring.lower()
+    
+    if position == 'start':
+        return key_lower.startswith(substring_lower)
+    elif position == 'end':
+        return key_lower.endswith(substring_lower)
+    return substring_lower in key_lower
+
+def remove_key(key_name):
+    try:
+        SESSION.post(
+            f'{IPFS_API}/api/v0/key/rm',
+            params={'arg': key_name},
+            timeout=5
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to remove {key_name}: {e}")
+
+def generate_candidate(key_name, substring, position, stop):
+    if stop.is_set():
+        return key_name, None, False
+    
+    try:
+        response = SESSION.post(
+            f'{IPFS_API}/api/v0/key/gen',
+            params={'arg': key_name, 'type': 'ed25519'},
+            timeout=5
+        )
+        
+        if response.status_code in (429, 503):
+            time.sleep(1)
+            return key_name, None, False
+        
+        if response.status_code != 200:
+            print(f"Error generating key: {response.text}")
+            return key_name, None, False
+        
+        key_id = response.json()['Id']
+        if matches_position(key_id, substring, position):
+            return key_name, key_id, True
+        
+        remove_key(key_name)
+        return key_name, key_id, False
+    
+    except requests.exceptions.RequestException as e:
+        print(f"Network error: {e}")
+        time.sleep(1)
+        return key_name, None, False
+
+def encode_base36(data):
+    value = int.from_bytes(data, 'big')
+    chunks = []
+    while value:
+        value, remainder = divmod(value, 46656)
+        chunks.append(BASE36_TRIPLETS[remainder])
+    return ''.join(reversed(chunks)).lstrip('0')
+
+def peer_id_from_public_key(public_key):
+    return 'k' + encode_base36(PEER_ID_PREFIX + public_key)
+
+def search_local_batch(args):
+    substring, position, count = args
+    substring = substring.lower()
+    if position == 'start':
+        matches = lambda key_id: key_id.startswith(substring)
+    elif position == 'end':
+        matches = lambda key_id: key_id.endswith(substring)
+    else:
+        matches = lambda key_id: substring in key_id
+    
+    generate = ed25519.Ed25519PrivateKey.generate
+    raw = serialization.Encoding.Raw
+    raw_public = serialization.PublicFormat.Raw
+    for _ in range(count):
+        private_key = generate()
+        public_key = private_key.public_key().public_bytes(raw, raw_public)
+        key_id = peer_id_from_public_key(public_key)
+        if matches(key_id):
+            seed = private_key.private_bytes(
+                serialization.Encoding.Raw,
+                serialization.PrivateFormat.Raw,
+                serialization.NoEncryption()
+            )
+            return seed + public_key, key_id
+    return None
+
+def key_file(key_name):
+    return KEYS_DIR / f'{key_name}.key'
+
+def save_key(key_name, key_data):
+    KEYS_DIR.mkdir(parents=True, exist_ok=True)
+    key_path = key_file(key_name)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(LIBP2P_ED25519_PRIVKEY_PREFIX + key_data)
+    return key_path
+
+def import_key(key_name, key_data):
+    try:
+        response = SESSION.post(
+            f'{IPFS_API}/api/v0/key/import',
+            params={'arg': key_name, 'format': 'libp2p-protobuf-cleartext'},
+            files={'file': (key_name, LIBP2P_ED25519_PRIVKEY_PREFIX + key_data)},
+            timeout=10
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Error importing key: {e}")
+        return None
+    
+    if response.status_code != 200:
+        print(f"Error importing key: {response.text}")
+        return None
+    return response.json()['Id']
+
+def generate_vanity_key_local(substring, max_attempts, position):
+    batches = [LOCAL_BATCH_SIZE] * (max_attempts // LOCAL_BATCH_SIZE)
+    if max_attempts % LOCAL_BATCH_SIZE:
+        batches.append(max_attempts % LOCAL_BATCH_SIZE)
+    
+    start_time = time.time()
+    last_report = start_time
+    attempts = 0
+    
+    with multiprocessing.Pool(os.cpu_count()) as pool:
+        try:
+            tasks = ((substring, position, count) for count in batches)
+            for count, result in zip(batches, pool.imap_unordered(search_local_batch, tasks)):
+                attempts += count
+                if result:
+                    pool.terminate()
+                    key_data, key_id = result
+                    elapsed = time.time() - start_time
+                    print(f"\n✓ FOUND! (~{attempts} attempts, {elapsed:.1f}s)")
+                    print(f"   Key ID: {key_id}")
+                    
+                    temp_key_name = f'temp_vanity_{int(time.time())}'
+                    try:
+                        key_path = save_key(temp_key_name, key_data)
+                        print(f"   Saved: {key_path}")
+                    except OSError as e:
+                        print(f"Error saving key: {e}")
+                        key_path = None
+                    
+                    imported_id = import_key(temp_key_name, key_data)
+                    if not imported_id:
+                        if key_path:
+                            print("\nThe key was saved but could not be imported. Import it manually:")
+                            print(f"  docker compose exec -T ipfs ipfs key import "
+                                  f"--format=libp2p-protobuf-cleartext {temp_key_name} < {key_path}")
+                        else:
+                            key_b64 = base64.b64encode(LIBP2P_ED25519_PRIVKEY_PREFIX + key_data).decode()
+                            print("\nThe key could not be saved or imported. Key (base64 libp2p protobuf):")
+                            print(f"  {key_b64}")
+                        sys.exit(1)
+                    if imported_id != key_id:
+                        print(f"\nError: IPFS reports key ID {imported_id}, expected {key_id}")
+                        print("Local peer ID encoding does not match the daemon, discarding key")
+                        remove_key(temp_key_name)
+                        sys.exit(1)
+                    print(f"   Name: {temp_key_name}")
+                    return temp_key_name, imported_id
+                
+                now = time.time()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    print(f"Attempt #{attempts} ({attempts / (now - start_time):.0f} keys/sec)")
+        
+        except KeyboardInterrupt:
+            pool.terminate()
+            print("\n\nSearch interrupted by user.")
+            return None, None
+    
+    print(f"\nReached max attempts ({max_attempts}) without finding a match.")
+    return None, None
 
 def generate_vanity_key(substring, max_attempts=100000, position='anywhere'):
     position_text = {
@@ -18,71 +220,65 @@ def generate_vanity_key(substring, max_attempts=100000, position='anywhere'):
     print(f"Searching for IPNS key {position_text.get(position, position_text['anywhere'])}...")
     print(f"This may take a while. Press Ctrl+C to stop.\n")
     
+    if ed25519 is not None:
+        return generate_vanity_key_local(substring, max_attempts, position)
+    
+    print("cryptography not installed, generating candidates through the IPFS API\n")
+    return generate_vanity_key_remote(substring, max_attempts, position)
+
+def generate_vanity_key_remote(substring, max_attempts=100000, position='anywhere'):
     start_time = time.time()
+    submitted = 0
     attempts = 0
-    found_keys = []
+    found = None
+    stop = threading.Event()
     
-    try:
-        while attempts < max_attempts:
-            attempts += 1
-            
-            temp_key_name = f'temp_vanity_{attempts}'
-            
-            try:
-                response = requests.post(
-                    f'{IPFS_API}/api/v0/key/gen',
-                    params={'arg': temp_key_name, 'type': 'ed25519'},
-                    timeout=5
-                )
-                
-                if response.status_code != 200:
-                    print(f"Error generating key: {response.text}")
-                    continue
-                
-                key_data = response.json()
-                key_id = key_data['Id']
-                key_lower = key_id.lower()
-                substring_lower = substring.lower()
-                
-                match_found = False
-                if position == 'start':
-                    match_found = key_lower.startswith(substring_lower)
-                elif position == 'end':
-                    match_found = key_lower.endswith(substring_lower)
-                else:
-                    match_found = substring_lower in key_lower
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        pending = set()
+        try:
+            while True:
+                while not stop.is_set() and submitted < max_attempts and len(pending) < CONCURRENCY:
+                    submitted += 1
+                    pending.add(executor.submit(
+                        generate_candidate, f'temp_vanity_{submitted}', substring, position, stop
+                    ))
                 
-                if match_found:
-                    elapsed = time.time() - start_time
-                    print(f"\n✓ FOUND! (attempt #{attempts}, {elapsed:.1f}s)")
-                    print(f"   Key ID: {key_id}")
-                    print(f"   Name: {temp_key_name}")
-                    found_keys.append((temp_key_name, key_id))
-                    return temp_key_name, key_id
-                
-                requests.post(
-                    f'{IPFS_API}/api/v0/key/rm',
-                    params={'arg': temp_key_name},
-                    timeout=5
-                )
+                if not pending:
+                    break
                 
-                if attempts % 100 == 0:
-                    elapsed = time.time() - start_time
-                    rate = attempts / elapsed
-                    print(f"Attempt #{attempts} ({rate:.0f} keys/sec)")
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key_name, key_id, matched = future.result()
+                    if key_id is None:
+                        continue
+                    
+                    attempts += 1
+                    if matched and found is None:
+                        stop.set()
+                        found = (key_name, key_id)
+                        elapsed = time.time() - start_time
+                        print(f"\n✓ FOUND! (attempt #{attempts}, {elapsed:.1f}s)")
+                        print(f"   Key ID: {key_id}")
+                        print(f"   Name: {key_name}")
+                    elif matched:
+                        remove_key(key_name)
                     
-            except requests.exceptions.RequestException as e:
-                print(f"Network error: {e}")
-                time.sleep(1)
-                continue
-    
-    except KeyboardInterrupt:
-        print("\n\nSearch interrupted by user.")
-        if found_keys:
-            print(f"\nFound {len(found_keys)} matching keys before interruption:")
-            for name, kid in found_keys:
-                print(f"  - {name}: {kid}")
-        return None, None
+                    if attempts % 100 == 0:
+                        elapsed = time.time() - start_time
+                        rate = attempts / elapsed
+                        print(f"Attempt #{attempts} ({rate:.0f} keys/sec)")
+        
+        except KeyboardInterrupt:
+            stop.set()
+            print("\n\nSearch interrupted by user.")
+            if found:
+                print(f"\nFound matching key before interruption:")
+                print(f"  - {found[0]}: {found[1]}")
+                return found
+            return None, None
+    
+    if found:
+        return found
     
     print(f"\nReached max attempts ({max_attempts}) without finding a match.")
     return None, None
@@ -129,7 +325,7 @@ def rename_key(old_name, new_name):
     print(f"\nRenaming key '{old_name}' to '{new_name}'...")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             f'{IPFS_API}/api/v0/key/rename',
             params={'arg': old_name, 'arg2': new_name},
             timeout=5
@@ -154,11 +350,12 @@ def main():
         print("  python3 generate-vanity-ipns.py radio 50000 sleetbubble-sex end")
         print("  python3 generate-vanity-ipns.py radio 50000 sleetbubble-sex start")
         print("\nPosition options: anywhere (default), start, end")
-        print("\nEstimated times (on modern CPU):")
-        print("  3-4 chars: seconds to minutes")
-        print("  5 chars:   30-60 minutes")
-        print("  6 chars:   1-2 days")
-        print("  Note: 'end' position is ~10x harder than 'anywhere'")
+        print("\nEstimated times (local search, ~20k keys/sec per CPU core, 8 cores):")
+        print("  3-5 chars: seconds")
+        print("  6 chars:   ~5 minutes")
+        print("  7 chars:   ~3 hours")
+        print("  Note: 'end' position is ~50x harder than 'anywhere'")
+        print("\nInstall 'cryptography' to generate candidates locally; the IPFS API fallback is much slower")
         sys.exit(1)
     
     substring = sys.argv[1]
@@ -171,7 +368,7 @@ def main():
     print("=" * 60)
     
     try:
-        response = requests.post(f'{IPFS_API}/api/v0/id', timeout=5)
+        response = SESSION.post(f'{IPFS_API}/api/v0/id', timeout=5)
         if response.status_code != 200:
             print("Error: Cannot connect to IPFS API")
             print("Make sure IPFS is running: docker compose up -d")
@@ -190,11 +387,12 @@ def main():
         print("  3. Different search term")
         sys.exit(1)
     
-    export_path = f'/workspaces/sleet_test/keys/{final_name}.key'
+    export_path = key_file(final_name)
     exported = export_key(temp_name, export_path)
     
     if exported:
-        rename_key(temp_name, final_name)
+        if rename_key(temp_name, final_name):
+            key_file(temp_name).unlink(missing_ok=True)
         
         print("\n" + "=" * 60)
         print("SUCCESS!")
@@ -5,40 +5,126 @@ import sys
 import json
 import requests
 import time
+import uuid
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 IPFS_API = os.getenv('IPFS_API', 'http://ipfs:5001')
 HLS_DIR = '/hls'
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.2)
+))
+
+def append_hash_log(hashes):
+    timestamp = int(time.time())
+    log_file = os.path.join(HLS_DIR, 'ipfs_hashes.log')
+    with open(log_file, 'ab') as log:
+        log.write(b''.join(
+            _dumps({'file': name, 'hash': hash_value, 'timestamp': timestamp}) + b'\n'
+            for name, hash_value in hashes.items()
+        ))
+
+def iter_multipart(file_paths, boundary):
+    for file_path in file_paths:
+        name = os.path.basename(file_path).replace('"', '%22')
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode('utf-8')
+
+def post_files(url, file_paths, **kwargs):
+    boundary = uuid.uuid4().hex
+    return SESSION.post(
+        url,
+        data=iter_multipart(file_paths, boundary),
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        **kwargs
+    )
 
 def add_to_ipfs(file_path):
     try:
-        with open(file_path, 'rb') as f:
-            files = {'file': f}
-            response = requests.post(f'{IPFS_API}/api/v0/add?pin=true', files=files)
+        response = post_files(f'{IPFS_API}/api/v0/add?pin=true', [file_path])
+        
+        if response.status_code == 200:
+            result = _loads(response.content)
+            hash_value = result['Hash']
+            print(f"Added {file_path} to IPFS: {hash_value}")
             
-            if response.status_code == 200:
-                result = response.json()
-                hash_value = result['Hash']
-                print(f"Added {file_path} to IPFS: {hash_value}")
-                
-                log_entry = {
-                    'file': os.path.basename(file_path),
-                    'hash': hash_value,
-                    'timestamp': int(time.time())
-                }
-                
-                log_file = os.path.join(HLS_DIR, 'ipfs_hashes.log')
-                with open(log_file, 'a') as log:
-                    log.write(json.dumps(log_entry) + '\n')
-                
-                return hash_value
-            else:
-                print(f"Error adding to IPFS: {response.text}")
-                return None
+            append_hash_log({os.path.basename(file_path): hash_value})
+            
+            return hash_value
+        else:
+            print(f"Error adding to IPFS: {response.text}")
+            return None
+    except Exception as e:
+        print(f"Exception adding to IPFS: {e}")
+        return None
+
+def add_many_to_ipfs(file_paths):
+    if not file_paths:
+        return {}
+    
+    try:
+        response = post_files(
+            f'{IPFS_API}/api/v0/add?pin=true&quiet=true',
+            file_paths,
+            stream=True
+        )
+        
+        if response.status_code == 200:
+            hashes = {}
+            for line in response.iter_lines():
+                if line:
+                    entry = _loads(line)
+                    hashes[entry['Name']] = entry['Hash']
+            print(f"Added {len(hashes)} files to IPFS")
+            
+            append_hash_log(hashes)
+            
+            return hashes
+        else:
+            print(f"Error adding to IPFS: {response.text}")
+            return None
     except Exception as e:
         print(f"Exception adding to IPFS: {e}")
         return None
 
+def load_hash_log():
+    log_file = os.path.join(HLS_DIR, 'ipfs_hashes.log')
+    try:
+        with open(log_file, 'rb') as log:
+            data = log.read()
+    except FileNotFoundError:
+        return {}
+    
+    entries = (_loads(line) for line in data.splitlines() if line.strip())
+    return {entry['file']: entry['hash'] for entry in entries}
+
 def update_m3u8_with_ipfs(m3u8_path):
     try:
         if not os.path.exists(m3u8_path):
@@ -47,16 +133,21 @@ def update_m3u8_with_ipfs(m3u8_path):
         with open(m3u8_path, 'r') as f:
             lines = f.readlines()
         
-        log_file = os.path.join(HLS_DIR, 'ipfs_hashes.log')
-        if not os.path.exists(log_file):
-            return
+        hashes = load_hash_log()
+        
+        m3u8_dir = os.path.dirname(m3u8_path)
+        pending = []
+        for line in lines:
+            segment = line.strip()
+            if segment.endswith('.ts') and os.path.basename(segment) not in hashes:
+                segment_path = os.path.join(m3u8_dir, segment)
+                if os.path.exists(segment_path) and segment_path not in pending:
+                    pending.append(segment_path)
         
-        hashes = {}
-        with open(log_file, 'r') as log:
-            for line in log:
-                if line.strip():
-                    entry = json.loads(line)
-                    hashes[entry['file']] = entry['hash']
+        if pending:
+            added = add_many_to_ipfs(pending)
+            if added:
+                hashes.update(added)
         
         new_lines = []
         for line in lines:
@@ -72,7 +163,7 @@ def update_m3u8_with_ipfs(m3u8_path):
         
         ipfs_m3u8_path = m3u8_path.replace('.m3u8', '_ipfs.m3u8')
         with open(ipfs_m3u8_path, 'w') as f:
-            f.writelines(new_lines)
+            f.write(''.join(new_lines))
         
         add_to_ipfs(ipfs_m3u8_path)
         